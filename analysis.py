@@ -0,0 +1,287 @@
+"""
+Helpers for inspecting the AST produced by the parser.
+Used by the optimization passes to find assigned variables, function
+definitions, call sites and which functions are free of side effects.
+"""
+
+ARITHMETIC_OPERATORS = {"+", "-", "*", "/"}
+
+
+def copy_ast(node):
+    """
+    Returns a deep copy of an AST node. The AST only holds dicts, lists and
+    plain values, which makes this much faster than copy.deepcopy.
+    """
+    if isinstance(node, dict):
+        return {key: copy_ast(value) for key, value in node.items()}
+    elif isinstance(node, list):
+        return [copy_ast(item) for item in node]
+    return node
+
+
+def nested_blocks(statement):
+    """
+    Returns the blocks directly nested inside a statement (then/else branches,
+    loop bodies and function bodies).
+    """
+    if "IfStatement" in statement:
+        if_stmt = statement["IfStatement"]
+        blocks = [if_stmt["Then"]]
+        if if_stmt.get("Else"):
+            blocks.append(if_stmt["Else"])
+        return blocks
+    elif "LoopStatement" in statement:
+        return [statement["LoopStatement"]["Block"]]
+    elif "DoUntilStatement" in statement:
+        return [statement["DoUntilStatement"]["Block"]]
+    elif "Function" in statement:
+        return [statement["Function"]["Body"]]
+    return []
+
+
+def statement_expressions(statement):
+    """
+    Returns the expressions evaluated by a statement itself, in evaluation order.
+    Expressions of nested blocks are not included.
+    """
+    if "Declaration" in statement:
+        return [statement["Declaration"]["Expression"]]
+    elif "Assignment" in statement:
+        return [statement["Assignment"]["Expression"]]
+    elif "IfStatement" in statement:
+        return [statement["IfStatement"]["Condition"]]
+    elif "LoopStatement" in statement:
+        return [statement["LoopStatement"]["IterationCount"]]
+    elif "DoUntilStatement" in statement:
+        return [statement["DoUntilStatement"]["Condition"]]
+    elif "OutputStatement" in statement:
+        return [statement["OutputStatement"]]
+    elif "Return" in statement:
+        return [statement["Return"]["Expression"]]
+    return []
+
+
+def walk_statements(block):
+    """
+    Yields every statement of a block, including those of nested blocks.
+    """
+    for statement in block:
+        yield statement
+        for nested in nested_blocks(statement):
+            yield from walk_statements(nested)
+
+
+def walk_expression(expression):
+    """
+    Yields an expression and all of its subexpressions (pre-order).
+    """
+    yield expression
+    if "Left" in expression and "Operator" in expression and "Right" in expression:
+        yield from walk_expression(expression["Left"])
+        yield from walk_expression(expression["Right"])
+    elif "FunctionCall" in expression:
+        for arg in expression["FunctionCall"]["Arguments"]:
+            yield from walk_expression(arg)
+
+
+def block_expressions(block):
+    """
+    Yields every expression node evaluated anywhere in a block.
+    """
+    for statement in walk_statements(block):
+        for expression in statement_expressions(statement):
+            yield from walk_expression(expression)
+
+
+def assigned_names(block):
+    """
+    Returns the set of variables declared or assigned anywhere in a block,
+    excluding the bodies of nested function definitions.
+    """
+    names = set()
+    for statement in block:
+        if "Declaration" in statement:
+            names.add(statement["Declaration"]["Identifier"])
+        elif "Assignment" in statement:
+            names.add(statement["Assignment"]["Identifier"])
+        if "Function" not in statement:
+            for nested in nested_blocks(statement):
+                names |= assigned_names(nested)
+    return names
+
+
+def local_functions(block):
+    """
+    Returns the names of functions defined anywhere in a block, excluding
+    those defined inside nested function definitions.
+    """
+    names = set()
+    for statement in block:
+        if "Function" in statement:
+            names.add(statement["Function"]["Name"])
+        else:
+            for nested in nested_blocks(statement):
+                names |= local_functions(nested)
+    return names
+
+
+def collect_functions(program):
+    """
+    Returns a dict mapping every function name to the list of its definitions.
+    """
+    functions = {}
+    for statement in walk_statements(program):
+        if "Function" in statement:
+            func = statement["Function"]
+            functions.setdefault(func["Name"], []).append(func)
+    return functions
+
+
+def called_functions(block):
+    """
+    Returns the set of function names called anywhere in a block.
+    """
+    return {expression["FunctionCall"]["Name"]
+            for expression in block_expressions(block)
+            if "FunctionCall" in expression}
+
+
+def pure_functions(program):
+    """
+    Returns the set of functions whose calls are provably free of side effects
+    and depend only on their arguments, so two calls with equal arguments
+    always produce the same value.
+
+    A function is pure if it is defined exactly once, never outputs, defines
+    no nested functions, reads no variables other than its parameters and
+    locals, and only calls pure functions. Recursion is allowed.
+    """
+    functions = collect_functions(program)
+    # Functions defined inside other functions are local to them; skip those
+    nested_names = {statement["Function"]["Name"]
+                    for definitions in functions.values()
+                    for func in definitions
+                    for statement in walk_statements(func["Body"])
+                    if "Function" in statement}
+    candidates = {}
+    for name, definitions in functions.items():
+        if len(definitions) != 1 or name in nested_names:
+            continue
+        func = definitions[0]
+        body = func["Body"]
+        if any("OutputStatement" in statement or "Function" in statement
+               for statement in walk_statements(body)):
+            continue
+        local_names = set(func["Parameters"]) | assigned_names(body)
+        read_names = {expression["Identifier"]
+                      for expression in block_expressions(body)
+                      if "Identifier" in expression}
+        if not read_names <= local_names:
+            continue
+        candidates[name] = called_functions(body)
+
+    # Drop functions that call anything impure until nothing changes
+    pure = set(candidates)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not candidates[name] <= pure:
+                pure.discard(name)
+                changed = True
+    return pure
+
+
+def call_graph(program):
+    """
+    Returns a dict mapping every defined function to the set of functions its
+    body calls.
+    """
+    graph = {}
+    for name, definitions in collect_functions(program).items():
+        graph[name] = set()
+        for func in definitions:
+            graph[name] |= called_functions(func["Body"])
+    return graph
+
+
+def recursive_functions(program):
+    """
+    Returns the set of functions that can reach themselves in the call graph.
+    """
+    graph = call_graph(program)
+    recursive = set()
+    for name in graph:
+        stack = list(graph[name])
+        seen = set()
+        while stack:
+            callee = stack.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee in seen:
+                continue
+            seen.add(callee)
+            stack.extend(graph.get(callee, ()))
+    return recursive
+
+
+def integer_names(program):
+    """
+    Returns the set of variables that only ever hold integers: every
+    assignment to them is an integer expression and they are never a
+    function parameter.
+    """
+    assignments = {}
+    parameters = set()
+    for statement in walk_statements(program):
+        for kind in ("Declaration", "Assignment"):
+            if kind in statement:
+                node = statement[kind]
+                assignments.setdefault(node["Identifier"], []).append(node["Expression"])
+        if "Function" in statement:
+            parameters |= set(statement["Function"]["Parameters"])
+
+    names = set(assignments) - parameters
+    changed = True
+    while changed:
+        changed = False
+        for name in list(names):
+            if not all(is_integer_expression(expression, names) for expression in assignments[name]):
+                names.discard(name)
+                changed = True
+    return names
+
+
+def is_integer_expression(expression, integer_names):
+    """
+    True if the expression always evaluates to an integer, given the set of
+    variables known to hold integers.
+    """
+    if "Literal" in expression:
+        return type(expression["Literal"]) is int
+    elif "Identifier" in expression:
+        return expression["Identifier"] in integer_names
+    elif ("Left" in expression and "Operator" in expression and "Right" in expression
+          and expression["Operator"] in ("+", "-", "*")):
+        return (is_integer_expression(expression["Left"], integer_names)
+                and is_integer_expression(expression["Right"], integer_names))
+    return False
+
+
+class ProgramSummary:
+    """
+    Whole-program facts, computed once before optimizing. Passes read them
+    from here so that parts of a program (such as single functions) can be
+    optimized separately and still get exactly the same result.
+    """
+
+    def __init__(self, program):
+        self.functions = collect_functions(program)
+        self.top_level_functions = {statement["Function"]["Name"]
+                                    for statement in program if "Function" in statement}
+        self.pure_functions = pure_functions(program)
+        self.recursive_functions = recursive_functions(program)
+        self.integer_names = integer_names(program)
+        # Facts derived from the summary by passes, computed once per summary
+        self.cache = {}
@@ -1,13 +1,29 @@
+import argparse
 import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import ProgramSummary
+from pass_manager import DEFAULT_OPTIMIZATION_LEVEL, OPTIMIZATION_LEVELS, PASSES, PassManager
+
+# Marks a top-level function whose code was generated separately
+FUNCTION_STUB = "CompiledFunction"
 
 
 class CodeGenerator:
-    def __init__(self, ast):
+    """
+    Emits Python code for an AST. Optimizations are not done here; they run
+    on the AST beforehand through the PassManager.
+    """
+
+    def __init__(self, ast, function_code=None):
         self.ast = ast
         self.indent_level = 0
         self.output_code = []
-        self.constants = {}
+        # Code of separately compiled top-level functions, see compile_program
+        self.function_code = function_code or []
 
     def generate(self):
         self._process_program(self.ast["Program"])
@@ -28,6 +44,8 @@ class CodeGenerator:
             self._process_loop_statement(statement["LoopStatement"])
         elif "OutputStatement" in statement:
             self._process_output_statement(statement["OutputStatement"])
+        elif FUNCTION_STUB in statement:
+            self.output_code.append(self.function_code[statement[FUNCTION_STUB]])
         elif "Function" in statement:
             self._process_function(statement["Function"])
         elif "Return" in statement:
@@ -39,117 +57,29 @@ class CodeGenerator:
 
     def _process_assignment(self, assignment):
         identifier = assignment["Identifier"]
-        expression = self._process_expression(
-            assignment["Expression"], skip_constants_for={identifier}
-        )
-
-        # Update constant map if the expression is a literal
-        if "Literal" in assignment["Expression"]:
-            self.constants[identifier] = expression
-        else:
-            self.constants.pop(identifier, None)  # Remove if no longer constant
-
+        expression = self._process_expression(assignment["Expression"])
         self.output_code.append(f"{self._indent()}{identifier} = {expression}")
 
     def _process_declaration(self, declaration):
         identifier = declaration["Identifier"]
-        expression = self._process_expression(
-            declaration["Expression"], skip_constants_for={identifier}
-        )
-
-        # Update constant map if the expression is a literal
-        if "Literal" in declaration["Expression"]:
-            self.constants[identifier] = expression
-        else:
-            self.constants.pop(identifier, None)  # Remove if no longer constant
-
+        expression = self._process_expression(declaration["Expression"])
         self.output_code.append(f"{self._indent()}{identifier} = {expression}")
 
     def _process_if_statement(self, if_stmt):
-        # Try to determine if the condition is a compile-time boolean
-        condition_expr = if_stmt["Condition"]
-        condition_value = self._evaluate_condition(condition_expr)
-
-        if condition_value is True:
-            # Condition is always True, process only 'Then' block
-            self._process_block(if_stmt["Then"])
-        elif condition_value is False:
-            # Condition is always False, process only 'Else' block if present
-            if "Else" in if_stmt:
-                self._process_block(if_stmt["Else"])
-            # If no else block, do nothing
-        else:
-            # Condition not known at compile time, generate normal if statement
-            condition = self._process_expression(if_stmt["Condition"])
-            self.output_code.append(f"{self._indent()}if {condition}:")
+        condition = self._process_expression(if_stmt["Condition"])
+        self.output_code.append(f"{self._indent()}if {condition}:")
+        self.indent_level += 1
+        self._process_block(if_stmt["Then"])
+        self.indent_level -= 1
+        # The parser stores a missing else block as None
+        if if_stmt.get("Else") is not None:
+            self.output_code.append(f"{self._indent()}else:")
             self.indent_level += 1
-            self._process_block(if_stmt["Then"])
+            self._process_block(if_stmt["Else"])
             self.indent_level -= 1
-            if "Else" in if_stmt:
-                self.output_code.append(f"{self._indent()}else:")
-                self.indent_level += 1
-                self._process_block(if_stmt["Else"])
-                self.indent_level -= 1
-
-    def _evaluate_condition(self, condition_expr):
-        """
-        Attempt to evaluate the condition at compile time.
-        Since your language requires conditions to be comparisons,
-        we handle them as booleans (True/False) if both sides are known.
-        Return True/False if evaluated, or None if not known at compile time.
-        """
-
-        # Handle direct literals or identifiers first
-        def eval_operand(op):
-            # If literal
-            if "Literal" in op:
-                return int(op["Literal"])
-            # If identifier and known constant
-            if "Identifier" in op:
-                identifier = op["Identifier"]
-                if identifier in self.constants and self.constants[identifier].isdigit():
-                    return int(self.constants[identifier])
-                return None  # unknown
-            # If a nested expression that we can evaluate
-            if "Left" in op and "Operator" in op and "Right" in op:
-                val = self._process_expression(op)
-                if val.isdigit():
-                    return int(val)
-                return None
-            return None
-
-        # If condition_expr is a comparison: it will have Left, Operator, Right
-        if "Left" in condition_expr and "Operator" in condition_expr and "Right" in condition_expr:
-            left_val = eval_operand(condition_expr["Left"])
-            right_val = eval_operand(condition_expr["Right"])
-            operator = condition_expr["Operator"]
-
-            # If we know both sides as integers, we can evaluate
-            if left_val is not None and right_val is not None:
-                if operator == "==":
-                    return left_val == right_val
-                elif operator == "!=":
-                    return left_val != right_val
-                elif operator == ">":
-                    return left_val > right_val
-                elif operator == ">=":
-                    return left_val >= right_val
-                elif operator == "<":
-                    return left_val < right_val
-                elif operator == "<=":
-                    return left_val <= right_val
-                # If some operator not handled, return None
-            return None
-        else:
-            # Not a comparison or can't evaluate
-            return None
 
     def _process_loop_statement(self, loop_stmt):
         iteration_count = self._process_expression(loop_stmt["IterationCount"])
-        # If iteration_count is known and zero, we can skip the loop entirely
-        if iteration_count.isdigit() and int(iteration_count) == 0:
-            # No loop needed
-            return
         self.output_code.append(
             f"{self._indent()}for _ in range({iteration_count}):")
         self.indent_level += 1
@@ -192,34 +122,28 @@ class CodeGenerator:
         self.output_code.append(f"{self._indent()}return {expression}")
 
     def _process_block(self, block):
+        # Python needs at least one statement in a block
+        if not block:
+            self.output_code.append(f"{self._indent()}pass")
         for statement in block:
             self._process_statement(statement)
 
-    def _process_expression(self, expression, skip_constants_for=None):
+    def _process_expression(self, expression):
         """
         Processes an expression, supporting literals, identifiers, composite expressions,
         function calls, and string operations.
-        Also applies constant folding, constant propagation, and algebraic simplifications.
-        :param skip_constants_for: A set of identifiers to skip constant propagation.
         """
         # Handle literals
         if "Literal" in expression:
             return str(expression["Literal"])
         # Handle identifiers
         elif "Identifier" in expression:
-            identifier = expression["Identifier"]
-            # Skip constant propagation for specified identifiers
-            if skip_constants_for and identifier in skip_constants_for:
-                return identifier
-            # Replace identifier with its constant value if available
-            if identifier in self.constants:
-                return self.constants[identifier]
-            return identifier
+            return expression["Identifier"]
         # Handle composite expressions (e.g., concatenations, arithmetic operations)
         elif "Left" in expression and "Operator" in expression and "Right" in expression:
-            left = self._process_expression(expression["Left"], skip_constants_for)
+            left = self._process_expression(expression["Left"])
             operator = expression["Operator"]
-            right = self._process_expression(expression["Right"], skip_constants_for)
+            right = self._process_expression(expression["Right"])
 
             # String concatenation handling
             if operator == "+":
@@ -230,52 +154,6 @@ class CodeGenerator:
                     right = f"str({right})" if not is_right_string else right
                     return f"{left} + {right}"
 
-            # Constant folding (if both operands are digits)
-            if left.isdigit() and right.isdigit():
-                left_value = int(left)
-                right_value = int(right)
-                if operator == "+":
-                    return str(left_value + right_value)
-                elif operator == "-":
-                    return str(left_value - right_value)
-                elif operator == "*":
-                    return str(left_value * right_value)
-                elif operator == "/":
-                    # Avoid division by zero in code gen (not handled by AST)
-                    if right_value != 0:
-                        return str(left_value / right_value)
-
-            # Algebraic simplifications when one side is a constant
-            left_is_digit = left.isdigit()
-            right_is_digit = right.isdigit()
-            if operator == "+":
-                # x + 0 -> x, 0 + x -> x
-                if right_is_digit and int(right) == 0:
-                    return left
-                if left_is_digit and int(left) == 0:
-                    return right
-            elif operator == "-":
-                # x - 0 -> x
-                if right_is_digit and int(right) == 0:
-                    return left
-            elif operator == "*":
-                # x * 1 -> x, 1 * x -> x
-                # x * 0 -> 0, 0 * x -> 0
-                if right_is_digit:
-                    if int(right) == 1:
-                        return left
-                    elif int(right) == 0:
-                        return "0"
-                if left_is_digit:
-                    if int(left) == 1:
-                        return right
-                    elif int(left) == 0:
-                        return "0"
-            elif operator == "/":
-                # x / 1 -> x
-                if right_is_digit and int(right) == 1:
-                    return left
-
             return f"({left} {operator} {right})"
         # Handle string literals explicitly
         elif "StringLiteral" in expression:
@@ -283,8 +161,8 @@ class CodeGenerator:
         # Handle function calls
         elif "FunctionCall" in expression:
             function_name = expression["FunctionCall"]["Name"]
-            arguments = [self._process_expression(
-                arg, skip_constants_for) for arg in expression["FunctionCall"]["Arguments"]]
+            arguments = [self._process_expression(arg)
+                         for arg in expression["FunctionCall"]["Arguments"]]
             return f"{function_name}({', '.join(arguments)})"
         else:
             raise ValueError("Unknown expression type.")
@@ -293,24 +171,108 @@ class CodeGenerator:
         return "    " * self.indent_level
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python code_generator.py <ast_file.json> <output_file.py>")
-        sys.exit(1)
+def compile_program(ast, passes, workers=1):
+    """
+    Optimizes a program with the given passes and generates its Python code.
+
+    Every top-level function is compiled as an independent unit, with its own
+    PassManager and CodeGenerator, so the units can be spread over `workers`
+    processes. The rest of the program is one more unit in which each of those
+    functions is a stub with an empty body; when it is emitted, the stubs are
+    replaced by the functions' code in source order. All units read the
+    whole-program facts from one ProgramSummary computed up front, so the
+    result is the same for any number of workers.
+
+    Returns the generated code and a PassManager with the merged statistics
+    and the wall time of the whole compilation.
+    """
+    start = time.perf_counter()
+    summary = ProgramSummary(ast["Program"]) if passes else None
+    main_program = []
+    function_units = []
+    for statement in ast["Program"]:
+        if "Function" in statement:
+            func = statement["Function"]
+            stub = {"Name": func["Name"], "Parameters": func["Parameters"], "Body": []}
+            main_program.append({"Function": stub, FUNCTION_STUB: len(function_units)})
+            function_units.append({"Program": [statement]})
+        else:
+            main_program.append(statement)
+
+    if workers > 1 and len(function_units) > 1:
+        chunksize = max(1, len(function_units) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(passes, summary)) as pool:
+            results = list(pool.map(_compile_function_unit, function_units, chunksize=chunksize))
+    else:
+        results = [_compile_unit(unit, passes, summary) for unit in function_units]
+
+    pass_manager = PassManager(passes)
+    main_ast = pass_manager.run({"Program": main_program}, summary)
+    function_code = []
+    for code, unit_pass_manager in results:
+        function_code.append(code)
+        pass_manager.merge(unit_pass_manager)
+    code = CodeGenerator(main_ast, function_code).generate()
+    pass_manager.wall_time = time.perf_counter() - start
+    return code, pass_manager
+
+
+def _compile_unit(unit, passes, summary):
+    pass_manager = PassManager(passes)
+    unit = pass_manager.run(unit, summary)
+    return CodeGenerator(unit).generate(), pass_manager
+
 
-    ast_file = sys.argv[1]
-    output_file = sys.argv[2]
+# Pipeline and summary of a worker process, sent once when it starts
+_worker_state = {}
+
+
+def _init_worker(passes, summary):
+    _worker_state["passes"] = passes
+    _worker_state["summary"] = summary
+
+
+def _compile_function_unit(unit):
+    return _compile_unit(unit, _worker_state["passes"], _worker_state["summary"])
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Generate Python code from a TutLang AST.")
+    arg_parser.add_argument("ast_file", help="AST produced by parser.py")
+    arg_parser.add_argument("output_file", help="Python file to write")
+    arg_parser.add_argument("-O", dest="level", type=int, choices=sorted(OPTIMIZATION_LEVELS),
+                            default=DEFAULT_OPTIMIZATION_LEVEL,
+                            help=f"optimization level (default: {DEFAULT_OPTIMIZATION_LEVEL})")
+    arg_parser.add_argument("--passes",
+                            help="comma-separated passes to run instead of an -O level: "
+                                 + ", ".join(PASSES))
+    arg_parser.add_argument("--report", action="store_true",
+                            help="print the time and changes of every pass and the inlined calls")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="worker processes for compiling top-level functions "
+                                 "(0: one per CPU, default: 1)")
+    args = arg_parser.parse_args()
 
     try:
-        with open(ast_file, "r") as f:
+        with open(args.ast_file, "r") as f:
             ast = json.load(f)
 
-        generator = CodeGenerator(ast)
-        python_code = generator.generate()
+        if args.passes is not None:
+            passes = [name for name in args.passes.split(",") if name]
+        else:
+            passes = PassManager.for_level(args.level).passes
+        workers = args.jobs or os.cpu_count()
+        python_code, pass_manager = compile_program(ast, passes, workers)
 
-        with open(output_file, "w") as f:
+        with open(args.output_file, "w") as f:
             f.write(python_code)
 
+        if args.report:
+            for line in pass_manager.report():
+                print(line)
+
     except Exception as e:
         print(f"An error occurred during code generation: {e}")
         sys.exit(1)
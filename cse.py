@@ -0,0 +1,249 @@
+from analysis import (
+    ARITHMETIC_OPERATORS,
+    ProgramSummary,
+    assigned_names,
+    nested_blocks,
+    walk_expression,
+)
+
+
+class CommonSubexpressionEliminator:
+    """
+    Common subexpression elimination based on value numbering.
+
+    Every arithmetic subexpression gets a value number built from its operator
+    and the value numbers of its operands, where a variable's value number
+    changes each time it is assigned. Subexpressions that share a value number
+    within a block (or within a single statement) are computed once into a
+    temporary `_cseN` declared right before the first statement that uses it,
+    and every occurrence is replaced by the temporary.
+
+    Function calls are only merged when the called function is pure (see
+    analysis.pure_functions). Expressions involving strings are left alone
+    because `+` on them is emitted as concatenation.
+    """
+
+    TEMP_PREFIX = "_cse"
+
+    def __init__(self, ast, summary=None):
+        self.ast = ast
+        summary = summary or ProgramSummary(self.ast["Program"])
+        self.pure_functions = summary.pure_functions
+        self.temp_count = 0
+        self.eliminated = 0
+
+        # State of the block currently being rewritten
+        self.versions = {}
+        self.counts = {}
+        self.temps = {}
+        self.hoisted = []
+        self.allow_new = True
+
+    @property
+    def changes(self):
+        return self.eliminated
+
+    def optimize(self):
+        self.ast["Program"] = self._process_block(self.ast["Program"])
+        return self.ast
+
+    def _process_block(self, block):
+        # Nested blocks are numbered separately, starting from scratch
+        for statement in block:
+            self._process_nested_blocks(statement)
+
+        # First count how often each value is computed, then rewrite
+        self.counts = {}
+        self.versions = {}
+        for statement in block:
+            self._enter_statement(statement)
+            for expression in self._evaluated_expressions(statement):
+                self._count(expression)
+            self._kill(statement)
+
+        result = []
+        self.temps = {}
+        self.versions = {}
+        for statement in block:
+            self._enter_statement(statement)
+            self._rewrite_statement(statement)
+            result.extend(self.hoisted)
+            result.append(statement)
+            self._kill(statement)
+        return result
+
+    def _process_nested_blocks(self, statement):
+        if "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            if_stmt["Then"] = self._process_block(if_stmt["Then"])
+            if if_stmt.get("Else"):
+                if_stmt["Else"] = self._process_block(if_stmt["Else"])
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            loop_stmt["Block"] = self._process_block(loop_stmt["Block"])
+        elif "DoUntilStatement" in statement:
+            do_until_stmt = statement["DoUntilStatement"]
+            do_until_stmt["Block"] = self._process_block(do_until_stmt["Block"])
+        elif "Function" in statement:
+            func = statement["Function"]
+            func["Body"] = self._process_block(func["Body"])
+
+    def _enter_statement(self, statement):
+        self.allow_new = self._is_pure_statement(statement)
+        self.hoisted = []
+
+    def _evaluated_expressions(self, statement):
+        """
+        Expressions evaluated once, before anything else the statement does.
+        A do-until condition runs after its block on every iteration, so it
+        is not part of the enclosing sequence.
+        """
+        if "Declaration" in statement:
+            return [statement["Declaration"]["Expression"]]
+        elif "Assignment" in statement:
+            return [statement["Assignment"]["Expression"]]
+        elif "IfStatement" in statement:
+            return [statement["IfStatement"]["Condition"]]
+        elif "LoopStatement" in statement:
+            return [statement["LoopStatement"]["IterationCount"]]
+        elif "OutputStatement" in statement:
+            return [statement["OutputStatement"]]
+        elif "Return" in statement:
+            return [statement["Return"]["Expression"]]
+        return []
+
+    def _rewrite_statement(self, statement):
+        if "Declaration" in statement or "Assignment" in statement:
+            node = statement.get("Declaration") or statement.get("Assignment")
+            node["Expression"] = self._rewrite(node["Expression"])
+        elif "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            if_stmt["Condition"] = self._rewrite(if_stmt["Condition"])
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            loop_stmt["IterationCount"] = self._rewrite(loop_stmt["IterationCount"])
+        elif "OutputStatement" in statement:
+            statement["OutputStatement"] = self._rewrite(statement["OutputStatement"])
+        elif "Return" in statement:
+            return_stmt = statement["Return"]
+            return_stmt["Expression"] = self._rewrite(return_stmt["Expression"])
+
+    def _kill(self, statement):
+        """
+        Gives a new value number to every variable the statement assigns.
+        """
+        if "Declaration" in statement:
+            names = {statement["Declaration"]["Identifier"]}
+        elif "Assignment" in statement:
+            names = {statement["Assignment"]["Identifier"]}
+        elif "Function" in statement:
+            names = set()
+        else:
+            names = set()
+            for nested in nested_blocks(statement):
+                names |= assigned_names(nested)
+        for name in names:
+            self.versions[name] = self.versions.get(name, 0) + 1
+
+    def _is_pure_statement(self, statement):
+        """
+        A temporary is only introduced in front of a statement that calls no
+        impure function, so moving the computation earlier cannot reorder it
+        with any output.
+        """
+        for expression in self._evaluated_expressions(statement):
+            for node in walk_expression(expression):
+                if "FunctionCall" in node and node["FunctionCall"]["Name"] not in self.pure_functions:
+                    return False
+        return True
+
+    def _value_number(self, expression):
+        """
+        Returns a hashable value number for the expression, or None if its
+        value cannot be shared (strings, impure calls, comparisons).
+        """
+        if "Literal" in expression:
+            # 2 and 2.0 are equal dict keys but not interchangeable values
+            value = expression["Literal"]
+            return ("Literal", type(value).__name__, value)
+        elif "Identifier" in expression:
+            identifier = expression["Identifier"]
+            return ("Identifier", identifier, self.versions.get(identifier, 0))
+        elif "Left" in expression and "Operator" in expression and "Right" in expression:
+            operator = expression["Operator"]
+            if operator not in ARITHMETIC_OPERATORS:
+                return None
+            left = self._value_number(expression["Left"])
+            right = self._value_number(expression["Right"])
+            if left is None or right is None:
+                return None
+            # a * b and b * a give the same result for both numbers and strings
+            if operator == "*" and repr(right) < repr(left):
+                left, right = right, left
+            return (operator, left, right)
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            if call["Name"] not in self.pure_functions:
+                return None
+            arguments = tuple(self._value_number(arg) for arg in call["Arguments"])
+            if None in arguments:
+                return None
+            return ("FunctionCall", call["Name"], arguments)
+        return None
+
+    def _is_candidate(self, value_number):
+        if value_number is None or value_number[0] in ("Literal", "Identifier"):
+            return False
+        return not self._is_foldable(value_number)
+
+    def _is_foldable(self, value_number):
+        """
+        True if the value only depends on literals, so constant folding can
+        compute it instead.
+        """
+        if value_number[0] == "Literal":
+            return True
+        elif value_number[0] in ("Identifier", "FunctionCall"):
+            return False
+        return self._is_foldable(value_number[1]) and self._is_foldable(value_number[2])
+
+    def _count(self, expression):
+        value_number = self._value_number(expression)
+        if self._is_candidate(value_number) and (self.allow_new or value_number in self.counts):
+            self.counts[value_number] = self.counts.get(value_number, 0) + 1
+            # Repeated occurrences are replaced as a whole, skip their operands
+            if self.counts[value_number] > 1:
+                return
+        for child in self._children(expression):
+            self._count(child)
+
+    def _rewrite(self, expression):
+        value_number = self._value_number(expression)
+        if self._is_candidate(value_number) and self.counts.get(value_number, 0) > 1:
+            if value_number in self.temps:
+                self.eliminated += 1
+                return {"Identifier": self.temps[value_number]}
+            if self.allow_new:
+                self._rewrite_children(expression)
+                temp = f"{self.TEMP_PREFIX}{self.temp_count}"
+                self.temp_count += 1
+                self.hoisted.append({"Declaration": {"Identifier": temp, "Expression": expression}})
+                self.temps[value_number] = temp
+                return {"Identifier": temp}
+        self._rewrite_children(expression)
+        return expression
+
+    def _rewrite_children(self, expression):
+        if "Left" in expression and "Operator" in expression and "Right" in expression:
+            expression["Left"] = self._rewrite(expression["Left"])
+            expression["Right"] = self._rewrite(expression["Right"])
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            call["Arguments"] = [self._rewrite(arg) for arg in call["Arguments"]]
+
+    def _children(self, expression):
+        if "Left" in expression and "Operator" in expression and "Right" in expression:
+            return [expression["Left"], expression["Right"]]
+        elif "FunctionCall" in expression:
+            return expression["FunctionCall"]["Arguments"]
+        return []
@@ -0,0 +1,815 @@
+import argparse
+import json
+import math
+import os
+import random
+import select
+import subprocess
+import sys
+
+from analysis import called_functions, copy_ast, nested_blocks, walk_statements
+from code_generator import compile_program
+from parser import Parser
+from pass_manager import OPTIMIZATION_LEVELS, PASSES
+from scanner import Scanner
+
+# Pipelines compared against the unoptimized program: every pass on its own
+# and every optimization level
+CONFIGURATIONS = {name: [name] for name in PASSES}
+CONFIGURATIONS.update({f"O{level}": passes for level, passes in OPTIMIZATION_LEVELS.items() if passes})
+
+DEFAULT_PROGRAMS = 50
+DEFAULT_REPEAT = 3
+DEFAULT_TIMEOUT = 10
+# Shrinking easily makes a loop endless, don't wait long for those
+SHRINK_TIMEOUT = 0.5
+
+# Reads one JSON request per line, runs the code in it `repeat` times with
+# fresh globals and answers with a JSON line holding the first run's stdout,
+# the name of the exception the program raised (or None) and the fastest
+# run time.
+RUNNER = """
+import contextlib, io, json, sys, time
+replies = sys.stdout
+for line in sys.stdin:
+    request = json.loads(line)
+    best = None
+    for run in range(request["repeat"]):
+        stdout = io.StringIO()
+        error = None
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(compile(request["code"], "<program>", "exec"), {"__name__": "__main__"})
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if run == 0:
+            output = stdout.getvalue()
+    replies.write(json.dumps({"stdout": output, "error": error, "time": best}) + "\\n")
+    replies.flush()
+"""
+
+# Exceptions meaning a reduced program is no longer a valid program
+INVALID_PROGRAM_ERRORS = {"NameError", "UnboundLocalError", "TypeError", "Timeout"}
+
+
+class ProgramGenerator:
+    """
+    Generates random TutLang programs that are valid and always terminate.
+
+    Variables are declared before they are read, loop counts are small
+    literals or counters that the loop body never assigns, and only earlier
+    functions are called, apart from a countdown function that recurses a few
+    times. Function bodies only read their parameters and locals, since a
+    Python function reading a global it also assigns fails. Subexpressions
+    are sometimes repeated and literals are biased towards 0 and 1 so the
+    optimizations have something to do.
+
+    Some variables (named `s<N>`) and functions hold strings, which are
+    concatenated, repeated and mixed into arithmetic. Some functions bind
+    the name of a top-level function to a nested function, a parameter or a
+    local, so calls in them reach a different function (or a number) than
+    the same call elsewhere, and some define a nested function that reads
+    their variables and calls their functions.
+    """
+
+    MAX_DEPTH = 2
+    MAX_COUNT = 3
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.name_count = 0
+        self.recent = []
+        # Name and arity of the functions returning a string
+        self.string_functions = {}
+        # Functions called by each generated top-level function
+        self.calls = {}
+        # Functions whose body is only declarations and a `return`, the
+        # shape the inliner works on
+        self.simple_functions = set()
+        # Functions binding the name of another one, and the names bound
+        self.shadowing_functions = []
+        self.shadowed = set()
+
+    def generate(self):
+        self.name_count = 0
+        self.string_functions = {}
+        self.calls = {}
+        self.simple_functions = set()
+        self.shadowing_functions = []
+        self.shadowed = set()
+        program = []
+        functions = {}
+        for _ in range(self.rng.randint(0, 4)):
+            program.append(self._function(functions))
+        if self.rng.random() < 0.3:
+            program.append(self._countdown_function(functions))
+
+        # Make sure the shadowing is exercised, before anything can fail
+        for name in self.shadowing_functions:
+            arity = functions[name] if name in functions else self.string_functions[name]
+            arguments = [self._expression([], functions, 3) for _ in range(arity)]
+            program.append({"OutputStatement": {"FunctionCall": {"Name": name, "Arguments": arguments}}})
+
+        variables = []
+        for _ in range(self.rng.randint(4, 12)):
+            program.extend(self._statement(variables, [], functions, 0))
+        for name in variables:
+            program.append({"OutputStatement": {"Identifier": name}})
+        return {"Program": program}
+
+    def _fresh_name(self, prefix):
+        name = f"{prefix}{self.name_count}"
+        self.name_count += 1
+        return name
+
+    def _function(self, functions):
+        name = self._fresh_name("f")
+        parameters = [self._fresh_name("p") for _ in range(self.rng.randint(0, 3))]
+        variables = list(parameters)
+        # Functions callable in the body, minus any name bound to a number
+        callees = dict(functions)
+        self.recent = []
+        body = []
+        # Each name is bound once, so the callers of the others stay inlinable
+        shadowable = sorted(callee for callee in functions
+                            if not callee.startswith("r") and callee not in self.shadowed)
+        # Prefer functions that other functions, above all simple ones, call
+        called = []
+        for callers in (self.simple_functions, self.calls):
+            called = sorted({callee for caller in callers for callee in self.calls[caller]} & set(shadowable))
+            if called:
+                shadowable = called
+                break
+        caller = None
+        if shadowable and self.rng.random() < (0.6 if called else 0.2):
+            shadowed = self.rng.choice(shadowable)
+            self.shadowed.add(shadowed)
+            self.shadowing_functions.append(name)
+            choice = self.rng.random()
+            if choice < 0.4:
+                body.append(self._shadowing_function(shadowed, functions))
+            else:
+                # A parameter or local with the name of the function
+                del callees[shadowed]
+                if choice < 0.7:
+                    parameters.append(shadowed)
+                else:
+                    body.append({"Declaration": {"Identifier": shadowed,
+                                                 "Expression": self._expression(variables, callees, 0)}})
+                variables.append(shadowed)
+            # Call a top-level function that calls the shadowed one, which
+            # must still reach the top-level definition
+            callers = sorted(function for function, names in self.calls.items()
+                             if shadowed in names and function in functions)
+            if callers:
+                caller = self.rng.choice([function for function in callers
+                                          if function in self.simple_functions] or callers)
+                if self.rng.random() < 0.7:
+                    body.append(self._local_call(caller, variables, callees))
+        # A nested function reading the names bound here, which may call the
+        # caller of the shadowed function from one scope further in
+        if caller or self.rng.random() < 0.2:
+            closure = self._closure(caller, variables, callees)
+            body.append(closure)
+            local = self._fresh_name("l")
+            body.append({"Declaration": {"Identifier": local, "Expression": {
+                "FunctionCall": {"Name": closure["Function"]["Name"], "Arguments": []}}}})
+            variables.append(local)
+        # Short bodies are the ones the inliner works on
+        for _ in range(self.rng.choice([0, 0, 1, 2, 3])):
+            local = self._fresh_name("l")
+            body.append({"Declaration": {"Identifier": local,
+                                         "Expression": self._expression(variables, callees, 0)}})
+            variables.append(local)
+        if variables and self.rng.random() < 0.3:
+            target = self.rng.choice(variables)
+            then_block = [{"Assignment": {"Identifier": target,
+                                          "Expression": self._expression(variables, callees, 0)}}]
+            body.append({"IfStatement": {"Condition": self._condition(variables, callees),
+                                         "Then": then_block, "Else": None}})
+        if self.rng.random() < 0.2:
+            body.append({"OutputStatement": self._output_expression(variables, callees)})
+        if self.rng.random() < 0.25:
+            body.append({"Return": {"Expression": self._string_expression(variables, callees, 0)}})
+            self.string_functions[name] = len(parameters)
+        else:
+            wrapped = sorted(callee for callee in callees if not callee.startswith("r"))
+            if wrapped and self.rng.random() < 0.3:
+                # A wrapper around another function
+                callee = self.rng.choice(wrapped)
+                arguments = [self._expression(variables, callees, 2) for _ in range(callees[callee])]
+                expression = {"FunctionCall": {"Name": callee, "Arguments": arguments}}
+            else:
+                expression = self._expression(variables, callees, 0)
+            body.append({"Return": {"Expression": expression}})
+            functions[name] = len(parameters)
+        self.calls[name] = called_functions(body)
+        if all("Declaration" in statement or "Return" in statement for statement in body):
+            self.simple_functions.add(name)
+        return {"Function": {"Name": name, "Parameters": parameters, "Body": body}}
+
+    def _local_call(self, function, variables, functions):
+        """
+        Returns the declaration of a new local holding a call to `function`.
+        """
+        # Plain arguments, so nothing keeps the call from being inlined
+        arguments = [self._expression(variables, functions, 3) for _ in range(functions[function])]
+        local = self._fresh_name("l")
+        variables.append(local)
+        return {"Declaration": {"Identifier": local, "Expression": {
+            "FunctionCall": {"Name": function, "Arguments": arguments}}}}
+
+    def _closure(self, caller, variables, functions):
+        """
+        Returns a nested function without parameters that reads the enclosing
+        function's variables and calls `caller` (if given) or the functions
+        callable there, including a nested one shadowing a top-level function.
+        """
+        name = self._fresh_name("f")
+        body = []
+        if self.rng.random() < 0.3:
+            body.append({"OutputStatement": {"StringLiteral": f"in {name}"}})
+        if caller:
+            body.append(self._local_call(caller, list(variables), functions))
+            expression = {"Identifier": body[-1]["Declaration"]["Identifier"]}
+        else:
+            expression = self._expression(variables, functions, 0)
+        body.append({"Return": {"Expression": expression}})
+        return {"Function": {"Name": name, "Parameters": [], "Body": body}}
+
+    def _shadowing_function(self, name, functions):
+        """
+        Returns a nested definition of the top-level function `name`, with
+        the same number of parameters but a different body.
+        """
+        parameters = [self._fresh_name("p") for _ in range(functions[name])]
+        # A call to `name` in here would be endless recursion
+        callees = {callee: arity for callee, arity in functions.items() if callee != name}
+        body = []
+        if self.rng.random() < 0.5:
+            body.append({"OutputStatement": {"StringLiteral": f"nested {name}"}})
+        body.append({"Return": {"Expression": self._expression(parameters, callees, 0)}})
+        # Its expressions read its own parameters, don't repeat them outside
+        self.recent = []
+        return {"Function": {"Name": name, "Parameters": parameters, "Body": body}}
+
+    def _countdown_function(self, functions):
+        name = self._fresh_name("r")
+        parameter = self._fresh_name("p")
+        n = {"Identifier": parameter}
+        body = [
+            {"IfStatement": {
+                "Condition": {"Left": n, "Operator": "<=", "Right": {"Literal": 0}},
+                "Then": [{"Return": {"Expression": {"Literal": 0}}}],
+                "Else": None,
+            }},
+            {"Return": {"Expression": {
+                "Left": copy_ast(n), "Operator": "+",
+                "Right": {"FunctionCall": {"Name": name, "Arguments": [
+                    {"Left": copy_ast(n), "Operator": "-", "Right": {"Literal": 1}}]}},
+            }}},
+        ]
+        # Only ever called with a literal, see _expression
+        functions[name] = 0
+        return {"Function": {"Name": name, "Parameters": [parameter], "Body": body}}
+
+    def _statement(self, variables, counters, functions, depth):
+        """
+        Returns a list of statements, since loops with a counter need its
+        declaration in front of them.
+        """
+        self.recent = []
+        readable = variables + counters
+        kind = self.rng.choices(["assign", "string", "output", "if", "loop", "do-until"],
+                                weights=[6, 1, 3, 2, 1, 1] if depth < self.MAX_DEPTH else [6, 1, 3, 0, 0, 0])[0]
+        if kind == "assign":
+            numbers = self._numbers(variables)
+            if numbers and self.rng.random() < 0.5:
+                target = self.rng.choice(numbers)
+                return [{"Assignment": {"Identifier": target,
+                                        "Expression": self._expression(readable, functions, 0)}}]
+            target = self._fresh_name("v")
+            expression = self._expression(readable, functions, 0)
+            variables.append(target)
+            return [{"Declaration": {"Identifier": target, "Expression": expression}}]
+        elif kind == "string":
+            strings = [name for name in variables if name.startswith("s")]
+            expression = self._string_expression(readable, functions, 0)
+            if strings and self.rng.random() < 0.5:
+                return [{"Assignment": {"Identifier": self.rng.choice(strings), "Expression": expression}}]
+            target = self._fresh_name("s")
+            variables.append(target)
+            return [{"Declaration": {"Identifier": target, "Expression": expression}}]
+        elif kind == "output":
+            return [{"OutputStatement": self._output_expression(readable, functions)}]
+        elif kind == "if":
+            condition = self._condition(readable, functions)
+            then_block = self._block(variables, counters, functions, depth + 1)
+            else_block = None
+            if self.rng.random() < 0.5:
+                else_block = self._block(variables, counters, functions, depth + 1)
+            return [{"IfStatement": {"Condition": condition, "Then": then_block, "Else": else_block}}]
+        elif kind == "loop":
+            if self.rng.random() < 0.5:
+                return [{"LoopStatement": {"IterationCount": {"Literal": self.rng.randint(0, self.MAX_COUNT)},
+                                           "Block": self._block(variables, counters, functions, depth + 1)}}]
+            counter = self._fresh_name("n")
+            declaration = {"Declaration": {"Identifier": counter,
+                                           "Expression": {"Literal": self.rng.randint(0, self.MAX_COUNT)}}}
+            block = self._block(variables, counters + [counter], functions, depth + 1)
+            return [declaration, {"LoopStatement": {"IterationCount": {"Identifier": counter}, "Block": block}}]
+
+        counter = self._fresh_name("i")
+        declaration = {"Declaration": {"Identifier": counter, "Expression": {"Literal": 0}}}
+        block = self._block(variables, counters + [counter], functions, depth + 1)
+        block.append({"Assignment": {"Identifier": counter, "Expression": {
+            "Left": {"Identifier": counter}, "Operator": "+", "Right": {"Literal": 1}}}})
+        condition = {"Left": {"Identifier": counter}, "Operator": ">=",
+                     "Right": {"Literal": self.rng.randint(1, self.MAX_COUNT)}}
+        return [declaration, {"DoUntilStatement": {"Block": block, "Condition": condition}}]
+
+    def _block(self, variables, counters, functions, depth):
+        # Variables declared in the block may not exist after it
+        variables = list(variables)
+        block = []
+        for _ in range(self.rng.randint(0, 3)):
+            block.extend(self._statement(variables, counters, functions, depth))
+        return block
+
+    def _condition(self, variables, functions):
+        # The scanner has no `!`, so `!=` is left out
+        operator = self.rng.choice(["==", "<", ">", "<=", ">="])
+        return {"Left": self._expression(variables, functions, 0), "Operator": operator,
+                "Right": self._expression(variables, functions, 0)}
+
+    def _output_expression(self, variables, functions):
+        choice = self.rng.random()
+        if choice < 0.2:
+            return self._string_expression(variables, functions, 0)
+        elif choice < 0.25:
+            # Raises a TypeError unless the string is a literal
+            return {"Left": self._string_expression(variables, functions, 0), "Operator": "+",
+                    "Right": self._expression(variables, functions, 0)}
+        elif choice < 0.3:
+            # Always raises a TypeError, also when the right side is the
+            # 0 or 1 that would make it a no-op on numbers
+            operator = self.rng.choice(["-", "/"])
+            right = {"Literal": 0 if operator == "-" else 1}
+            if self.rng.random() < 0.5:
+                right = self._expression(variables, functions, 0)
+            return {"Left": self._string_value(variables, functions), "Operator": operator, "Right": right}
+        expression = self._expression(variables, functions, 0)
+        if self.rng.random() < 0.3:
+            return {"Left": {"StringLiteral": "value: "}, "Operator": "+", "Right": expression}
+        return expression
+
+    def _numbers(self, variables):
+        return [name for name in variables if not name.startswith("s")]
+
+    def _string_value(self, variables, functions):
+        """
+        Returns a string variable or a call to a string function, whose type
+        is only known at run time, or any string expression if there are none.
+        """
+        strings = [name for name in variables if name.startswith("s")]
+        if strings and (not self.string_functions or self.rng.random() < 0.5):
+            return {"Identifier": self.rng.choice(strings)}
+        elif self.string_functions:
+            return self._string_call(variables, functions)
+        return self._string_expression(variables, functions, 0)
+
+    def _string_call(self, variables, functions):
+        name = self.rng.choice(sorted(self.string_functions))
+        arguments = [self._expression(variables, functions, 1) for _ in range(self.string_functions[name])]
+        return {"FunctionCall": {"Name": name, "Arguments": arguments}}
+
+    def _string_expression(self, variables, functions, depth):
+        strings = [name for name in variables if name.startswith("s")]
+        choice = self.rng.random()
+        if depth >= 2 or choice < 0.2:
+            return {"StringLiteral": self._fresh_name("text ")}
+        elif choice < 0.35 and strings:
+            return {"Identifier": self.rng.choice(strings)}
+        elif choice < 0.6 and self.string_functions:
+            return self._string_call(variables, functions)
+        elif choice < 0.8:
+            return {"Left": {"Literal": self.rng.randint(0, 3)}, "Operator": "*",
+                    "Right": self._string_expression(variables, functions, depth + 1)}
+        right = self._expression(variables, functions, 1)
+        if strings and self.rng.random() < 0.3:
+            right = {"Identifier": self.rng.choice(strings)}
+        return {"Left": {"StringLiteral": self._fresh_name("text ")}, "Operator": "+", "Right": right}
+
+    def _expression(self, variables, functions, depth):
+        if self.recent and self.rng.random() < 0.15:
+            return copy_ast(self.rng.choice(self.recent))
+        variables = self._numbers(variables)
+        choice = self.rng.random()
+        if depth >= 3 or choice < 0.3:
+            if variables and self.rng.random() < 0.6:
+                return {"Identifier": self.rng.choice(variables)}
+            return {"Literal": self.rng.choice([0, 1, 1, 2, 3, self.rng.randint(0, 100)])}
+        elif choice < 0.85 or not functions:
+            operator = self.rng.choices(["+", "-", "*", "/"], weights=[4, 3, 3, 1])[0]
+            left = self._expression(variables, functions, depth + 1)
+            if operator == "/" and self.rng.random() < 0.8:
+                # Most programs should get past their divisions
+                right = {"Literal": self.rng.randint(1, 9)}
+            else:
+                right = self._expression(variables, functions, depth + 1)
+            expression = {"Left": left, "Operator": operator, "Right": right}
+        else:
+            name = self.rng.choice(sorted(functions))
+            if name.startswith("r"):
+                arguments = [{"Literal": self.rng.randint(0, 5)}]
+            else:
+                arguments = [self._expression(variables, functions, depth + 1) for _ in range(functions[name])]
+            expression = {"FunctionCall": {"Name": name, "Arguments": arguments}}
+        self.recent.append(expression)
+        return expression
+
+
+def format_program(ast):
+    """
+    Returns the TutLang source of an AST.
+    """
+    lines = []
+    _format_block(ast["Program"], 0, lines)
+    return "\n".join(lines) + "\n"
+
+
+def _format_block(block, indent_level, lines):
+    indent = "    " * indent_level
+    for statement in block:
+        if "Declaration" in statement:
+            node = statement["Declaration"]
+            lines.append(f"{indent}declare {node['Identifier']} <- {_format_expression(node['Expression'])}")
+        elif "Assignment" in statement:
+            node = statement["Assignment"]
+            lines.append(f"{indent}{node['Identifier']} <- {_format_expression(node['Expression'])}")
+        elif "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            lines.append(f"{indent}if ({_format_condition(if_stmt['Condition'])}) {{")
+            _format_block(if_stmt["Then"], indent_level + 1, lines)
+            if if_stmt.get("Else") is not None:
+                lines.append(f"{indent}}} else {{")
+                _format_block(if_stmt["Else"], indent_level + 1, lines)
+            lines.append(f"{indent}}}")
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            lines.append(f"{indent}loop {_format_expression(loop_stmt['IterationCount'])} {{")
+            _format_block(loop_stmt["Block"], indent_level + 1, lines)
+            lines.append(f"{indent}}}")
+        elif "DoUntilStatement" in statement:
+            do_until_stmt = statement["DoUntilStatement"]
+            lines.append(f"{indent}do {{")
+            _format_block(do_until_stmt["Block"], indent_level + 1, lines)
+            lines.append(f"{indent}}} until ({_format_condition(do_until_stmt['Condition'])})")
+        elif "OutputStatement" in statement:
+            lines.append(f"{indent}output {_format_expression(statement['OutputStatement'])}")
+        elif "Function" in statement:
+            func = statement["Function"]
+            lines.append(f"{indent}def {func['Name']}({', '.join(func['Parameters'])}) {{")
+            _format_block(func["Body"], indent_level + 1, lines)
+            lines.append(f"{indent}}}")
+        elif "Return" in statement:
+            lines.append(f"{indent}return {_format_expression(statement['Return']['Expression'])}")
+
+
+def _format_condition(condition):
+    # The parser reads a condition as two expressions around an operator,
+    # so it cannot be wrapped in parentheses
+    return (f"{_format_expression(condition['Left'])} {condition['Operator']} "
+            f"{_format_expression(condition['Right'])}")
+
+
+def _format_expression(expression):
+    if "Literal" in expression:
+        return str(expression["Literal"])
+    elif "Identifier" in expression:
+        return expression["Identifier"]
+    elif "StringLiteral" in expression:
+        return f'"{expression["StringLiteral"]}"'
+    elif "FunctionCall" in expression:
+        call = expression["FunctionCall"]
+        arguments = ", ".join(_format_expression(arg) for arg in call["Arguments"])
+        return f"{call['Name']}({arguments})"
+    return f"({_format_condition(expression)})"
+
+
+def parse_source(source):
+    """
+    Runs the scanner and parser on TutLang source, the same way the
+    command-line tools pass tokens from one to the other.
+    """
+    tokens = Scanner().scan(source)
+    if tokens is None:
+        raise SyntaxError("Lexical error in generated program")
+    return Parser([(token_type, value.strip('"')) for token_type, value in tokens]).parse()
+
+
+class ProgramRunner:
+    """
+    Runs generated Python code in a separate interpreter, which is reused
+    across programs so starting Python is not part of the measured time.
+    A program that runs out of time is stopped by restarting the interpreter.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.process = None
+
+    def run(self, code, repeat=1, timeout=None):
+        """
+        Returns the program's stdout, the exception it raised (None if it
+        finished normally) and its fastest run time. `timeout` overrides the
+        runner's time limit per run.
+        """
+        if self.process is None:
+            self.process = subprocess.Popen([sys.executable, "-c", RUNNER], stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, text=True)
+        self.process.stdin.write(json.dumps({"code": code, "repeat": repeat}) + "\n")
+        self.process.stdin.flush()
+        ready, _, _ = select.select([self.process.stdout], [], [], (timeout or self.timeout) * repeat)
+        reply = self.process.stdout.readline() if ready else ""
+        if not reply:
+            # Out of time, or the interpreter itself crashed
+            error = "Timeout" if not ready else f"exit status {self.process.poll()}"
+            self.close()
+            return {"stdout": None, "error": error, "time": None}
+        return json.loads(reply)
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process = None
+
+
+def same_behavior(expected, actual):
+    return expected["stdout"] == actual["stdout"] and expected["error"] == actual["error"]
+
+
+class Shrinker:
+    """
+    Reduces a failing program to a small one that still fails.
+
+    Edits are tried one at a time and kept whenever `is_failing` still holds:
+    removing a statement, replacing an if or a loop by the statements of one
+    of its blocks, and replacing an expression by one of its operands or by a
+    small literal. This repeats until no edit is kept.
+    """
+
+    def __init__(self, is_failing):
+        self.is_failing = is_failing
+        self.ast = None
+
+    def shrink(self, ast):
+        self.ast = copy_ast(ast)
+        changed = True
+        while changed:
+            changed = self._shrink_block(self.ast["Program"])
+            for statement in list(walk_statements(self.ast["Program"])):
+                for container, key in self._expression_slots(statement):
+                    changed |= self._shrink_expression(container, key)
+        return self.ast
+
+    def _still_failing(self):
+        return self.is_failing(self.ast)
+
+    def _shrink_block(self, block):
+        changed = False
+        i = len(block) - 1
+        while i >= 0:
+            statement = block[i]
+            for replacement in self._statement_replacements(statement):
+                block[i:i + 1] = replacement
+                if self._still_failing():
+                    changed = True
+                    break
+                block[i:i + len(replacement)] = [statement]
+            else:
+                for nested in nested_blocks(statement):
+                    changed |= self._shrink_block(nested)
+            i -= 1
+        return changed
+
+    def _statement_replacements(self, statement):
+        replacements = [[]]
+        if "Function" not in statement:
+            replacements.extend(copy_ast(nested) for nested in nested_blocks(statement) if nested)
+        return replacements
+
+    def _expression_slots(self, statement):
+        """
+        Returns (container, key) pairs holding the expressions of a statement.
+        A condition must stay a comparison, so only its operands are listed.
+        """
+        if "Declaration" in statement or "Assignment" in statement:
+            return [(statement.get("Declaration") or statement.get("Assignment"), "Expression")]
+        elif "IfStatement" in statement:
+            condition = statement["IfStatement"]["Condition"]
+            return [(condition, "Left"), (condition, "Right")]
+        elif "LoopStatement" in statement:
+            return [(statement["LoopStatement"], "IterationCount")]
+        elif "DoUntilStatement" in statement:
+            condition = statement["DoUntilStatement"]["Condition"]
+            return [(condition, "Left"), (condition, "Right")]
+        elif "OutputStatement" in statement:
+            return [(statement, "OutputStatement")]
+        elif "Return" in statement:
+            return [(statement["Return"], "Expression")]
+        return []
+
+    def _shrink_expression(self, container, key):
+        expression = container[key]
+        for replacement in self._expression_replacements(expression):
+            container[key] = replacement
+            if self._still_failing():
+                self._shrink_expression(container, key)
+                return True
+        container[key] = expression
+
+        changed = False
+        if "Left" in expression and "Operator" in expression and "Right" in expression:
+            changed |= self._shrink_expression(expression, "Left")
+            changed |= self._shrink_expression(expression, "Right")
+        elif "FunctionCall" in expression:
+            arguments = expression["FunctionCall"]["Arguments"]
+            for i in range(len(arguments)):
+                changed |= self._shrink_expression(arguments, i)
+        return changed
+
+    def _expression_replacements(self, expression):
+        if "Left" in expression and "Operator" in expression and "Right" in expression:
+            replacements = [expression["Left"], expression["Right"]]
+        elif "FunctionCall" in expression:
+            replacements = list(expression["FunctionCall"]["Arguments"])
+        else:
+            replacements = []
+        # A literal is only replaced by a smaller one, so shrinking ends
+        if "Literal" in expression:
+            replacements.extend({"Literal": value} for value in (0, 1) if value < expression["Literal"])
+        elif "StringLiteral" not in expression:
+            replacements.extend([{"Literal": 0}, {"Literal": 1}])
+        return replacements
+
+
+class DifferentialTester:
+    """
+    Compiles programs without optimization and with each configuration,
+    runs every version and checks that they print the same output and raise
+    the same exception. Records the run time and generated code size of each
+    configuration relative to the unoptimized program, and shrinks every
+    mismatch to a small reproducer.
+    """
+
+    def __init__(self, configurations, runner, repeat=DEFAULT_REPEAT):
+        self.configurations = configurations
+        self.runner = runner
+        self.repeat = repeat
+        self.skipped = 0
+        self.failures = []
+        self.stats = {name: {"programs": 0, "failures": 0, "speedups": [], "baseline_size": 0, "size": 0}
+                      for name in configurations}
+
+    def check(self, ast):
+        """
+        Tests one program against every configuration. Returns False if any
+        of them changed its behavior.
+        """
+        baseline_code, _ = compile_program(ast, [])
+        baseline = self.runner.run(baseline_code, self.repeat)
+        if baseline["time"] is None:
+            # Not a usable program, e.g. one that runs out of time
+            self.skipped += 1
+            return True
+
+        passed = True
+        for name, passes in self.configurations.items():
+            stats = self.stats[name]
+            stats["programs"] += 1
+            try:
+                code, _ = compile_program(ast, passes)
+            except Exception as e:
+                result = {"stdout": None, "error": f"compiler error: {e}", "time": None}
+                code = ""
+            else:
+                result = self.runner.run(code, self.repeat)
+            if not same_behavior(baseline, result):
+                stats["failures"] += 1
+                self.failures.append(self._reproduce(ast, name, passes, baseline["error"]))
+                passed = False
+                continue
+            if baseline["time"] > 0 and result["time"] > 0:
+                stats["speedups"].append(baseline["time"] / result["time"])
+            stats["baseline_size"] += len(baseline_code)
+            stats["size"] += len(code)
+        return passed
+
+    def _reproduce(self, ast, name, passes, baseline_error):
+        """
+        Shrinks a program whose behavior `passes` changed and returns the
+        failure report for it.
+        """
+        def is_failing(candidate):
+            try:
+                baseline_code, _ = compile_program(candidate, [])
+            except Exception:
+                return False
+            baseline = self.runner.run(baseline_code, timeout=SHRINK_TIMEOUT)
+            # Shrinking must not turn the program into an invalid one
+            if baseline["error"] != baseline_error and baseline["error"] in INVALID_PROGRAM_ERRORS:
+                return False
+            try:
+                code, _ = compile_program(candidate, passes)
+            except Exception:
+                return True
+            return not same_behavior(baseline, self.runner.run(code, timeout=SHRINK_TIMEOUT))
+
+        reduced = Shrinker(is_failing).shrink(ast)
+        baseline_code, _ = compile_program(reduced, [])
+        try:
+            code, _ = compile_program(reduced, passes)
+            result = self.runner.run(code)
+        except Exception as e:
+            code = f"compiler error: {e}"
+            result = {"stdout": None, "error": "compiler error"}
+        baseline = self.runner.run(baseline_code)
+        return {"configuration": name, "source": format_program(reduced), "baseline_code": baseline_code,
+                "code": code, "expected": baseline, "actual": result}
+
+    def report(self):
+        lines = [f"{'Configuration':<26}{'Programs':>9}{'Failures':>9}{'Speedup':>9}{'Code size':>11}"]
+        for name, stats in self.stats.items():
+            speedups = stats["speedups"]
+            # Geometric mean, so a 2x speedup and a 2x slowdown cancel out
+            speedup = math.exp(sum(math.log(s) for s in speedups) / len(speedups)) if speedups else 1.0
+            size = stats["size"] / stats["baseline_size"] if stats["baseline_size"] else 1.0
+            lines.append(f"{name:<26}{stats['programs']:>9}{stats['failures']:>9}"
+                         f"{speedup:>8.3f}x{size:>10.3f}x")
+        if self.skipped:
+            lines.append(f"Skipped {self.skipped} programs that did not finish without optimization")
+
+        for failure in self.failures:
+            lines.append("")
+            lines.append(f"Mismatch with {failure['configuration']}, reduced program:")
+            lines.extend(failure["source"].splitlines())
+            lines.append("Unoptimized code:")
+            lines.extend(failure["baseline_code"].splitlines())
+            lines.append("Optimized code:")
+            lines.extend(failure["code"].splitlines())
+            for label, result in (("Expected", failure["expected"]), ("Actual", failure["actual"])):
+                lines.append(f"{label} output: {result['stdout']!r}, error: {result['error']}")
+        return lines
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Check that the optimizer does not change the behavior of random TutLang programs, "
+                    "and measure how much each optimization speeds them up.")
+    arg_parser.add_argument("-n", "--programs", type=int, default=DEFAULT_PROGRAMS,
+                            help=f"number of programs to generate (default: {DEFAULT_PROGRAMS})")
+    arg_parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    arg_parser.add_argument("--configurations",
+                            help="comma-separated configurations to test (default: all): "
+                                 + ", ".join(CONFIGURATIONS))
+    arg_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                            help=f"runs per program, the fastest is recorded (default: {DEFAULT_REPEAT})")
+    arg_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                            help=f"seconds a program may run (default: {DEFAULT_TIMEOUT})")
+    arg_parser.add_argument("--save", metavar="DIR",
+                            help="also write every generated program to DIR")
+    args = arg_parser.parse_args()
+
+    configurations = CONFIGURATIONS
+    if args.configurations is not None:
+        names = [name for name in args.configurations.split(",") if name]
+        unknown = [name for name in names if name not in CONFIGURATIONS]
+        if unknown:
+            arg_parser.error(f"unknown configuration: {', '.join(unknown)}")
+        configurations = {name: CONFIGURATIONS[name] for name in names}
+
+    rng = random.Random(args.seed)
+    generator = ProgramGenerator(rng)
+    runner = ProgramRunner(args.timeout)
+    tester = DifferentialTester(configurations, runner, args.repeat)
+    try:
+        for index in range(args.programs):
+            source = format_program(generator.generate())
+            if args.save:
+                os.makedirs(args.save, exist_ok=True)
+                with open(os.path.join(args.save, f"program{index}.tut"), "w") as f:
+                    f.write(source)
+            tester.check(parse_source(source))
+    finally:
+        runner.close()
+
+    for line in tester.report():
+        print(line)
+    sys.exit(1 if tester.failures else 0)
@@ -0,0 +1,301 @@
+from analysis import (
+    ProgramSummary,
+    assigned_names,
+    block_expressions,
+    called_functions,
+    copy_ast,
+    local_functions,
+    walk_expression,
+)
+
+PROGRAM_NAME = "<program>"
+
+
+class Inliner:
+    """
+    Inlines calls to small, non-recursive functions.
+
+    A function can be inlined if it is defined once at the top level, reads
+    only its parameters and locals, only calls functions defined once at the
+    top level, returns no string and its body is a few declarations or
+    assignments followed by a single `return`. Its size in AST nodes, counting
+    the bodies of the calls inlined into it, is at most `max_size`, so the
+    code grows by at most that much per call site. The call is replaced by
+    the returned expression with parameters substituted; locals and
+    parameters that need their own storage are renamed to `_inlN_<name>`
+    and declared in front of the calling statement, so they cannot clash
+    with the caller's variables.
+
+    Arguments are substituted directly when that keeps them evaluated exactly
+    once; otherwise they are stored in a temporary, which (like the body's
+    local statements) is only allowed when the calling statement calls no
+    impure function. Inside a function, a call is not inlined if the body
+    calls a name that is local to the caller or to a function enclosing it,
+    since the call would reach that local instead of the top-level function.
+    Calls that cannot be inlined are left untouched.
+    """
+
+    TEMP_PREFIX = "_inl"
+    DEFAULT_MAX_SIZE = 20
+
+    def __init__(self, ast, summary=None, max_size=DEFAULT_MAX_SIZE):
+        self.ast = ast
+        self.max_size = max_size
+        summary = summary or ProgramSummary(self.ast["Program"])
+        self.pure_functions = summary.pure_functions
+        cache_key = ("inlinable", max_size)
+        if cache_key not in summary.cache:
+            summary.cache[cache_key] = self._find_inlinable(summary)
+        self.inlinable = summary.cache[cache_key]
+        self.instance_count = 0
+        # (caller, callee) for every inlined call, in program order
+        self.inlined = []
+
+        # State of the statement currently being rewritten
+        self.caller = PROGRAM_NAME
+        self.caller_locals = set()
+        self.hoisted = []
+        self.allow_hoist = True
+
+    @property
+    def changes(self):
+        return len(self.inlined)
+
+    @property
+    def messages(self):
+        return [f"Inlined call to {callee} in {caller}" for caller, callee in self.inlined]
+
+    def optimize(self):
+        self.ast["Program"] = self._process_block(self.ast["Program"])
+        return self.ast
+
+    def _find_inlinable(self, summary):
+        candidates = {}
+        for name in sorted(summary.top_level_functions):
+            if self._is_unique(name, summary) and name not in summary.recursive_functions:
+                func = summary.functions[name][0]
+                if self._is_inlinable(func, summary):
+                    candidates[name] = func
+
+        # Inlining a body also inlines the calls in it, so a function's size
+        # includes the size of its inlinable callees. Candidates are not
+        # recursive, so callees can be sized first.
+        sizes = {}
+        inlinable = {}
+        for name in self._callees_first(candidates):
+            body = candidates[name]["Body"]
+            size = len(body)
+            for expression in block_expressions(body):
+                size += 1
+                if "FunctionCall" in expression and expression["FunctionCall"]["Name"] in inlinable:
+                    size += sizes[expression["FunctionCall"]["Name"]] - 1
+            if size <= self.max_size:
+                sizes[name] = size
+                inlinable[name] = candidates[name]
+        return inlinable
+
+    def _is_unique(self, name, summary):
+        # A name defined more than once anywhere may refer to either body
+        return name in summary.top_level_functions and len(summary.functions[name]) == 1
+
+    def _callees_first(self, candidates):
+        """
+        Orders the candidates so that every function comes after the
+        candidates it calls.
+        """
+        order = []
+        visited = set()
+        for name in candidates:
+            stack = [(name, False)]
+            while stack:
+                current, finished = stack.pop()
+                if finished:
+                    order.append(current)
+                    continue
+                if current in visited:
+                    continue
+                visited.add(current)
+                stack.append((current, True))
+                stack.extend((callee, False) for callee in called_functions(candidates[current]["Body"])
+                             if callee in candidates and callee not in visited)
+        return order
+
+    def _is_inlinable(self, func, summary):
+        body = func["Body"]
+        if not body or "Return" not in body[-1]:
+            return False
+        for statement in body[:-1]:
+            if "Declaration" not in statement and "Assignment" not in statement:
+                return False
+        # `+` with a string is emitted without parentheses, so it cannot be
+        # placed inside the caller's expression
+        if any("StringLiteral" in node for node in walk_expression(body[-1]["Return"]["Expression"])):
+            return False
+        local_names = set(func["Parameters"]) | assigned_names(body)
+        for expression in block_expressions(body):
+            if "Identifier" in expression and expression["Identifier"] not in local_names:
+                return False
+            if "FunctionCall" in expression:
+                callee = expression["FunctionCall"]["Name"]
+                # The call moves into the caller's scope and must still reach the same function
+                if not self._is_unique(callee, summary):
+                    return False
+                # Local statements are moved in front of the caller's statement,
+                # which is only safe if they cannot produce output
+                if len(body) > 1 and callee not in self.pure_functions:
+                    return False
+        return True
+
+    def _process_block(self, block):
+        result = []
+        for statement in block:
+            self._process_nested_blocks(statement)
+            self.hoisted = []
+            self.allow_hoist = self._is_pure_statement(statement)
+            self._rewrite_statement(statement)
+            result.extend(self.hoisted)
+            result.append(statement)
+        return result
+
+    def _process_nested_blocks(self, statement):
+        if "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            if_stmt["Then"] = self._process_block(if_stmt["Then"])
+            if if_stmt.get("Else"):
+                if_stmt["Else"] = self._process_block(if_stmt["Else"])
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            loop_stmt["Block"] = self._process_block(loop_stmt["Block"])
+        elif "DoUntilStatement" in statement:
+            do_until_stmt = statement["DoUntilStatement"]
+            do_until_stmt["Block"] = self._process_block(do_until_stmt["Block"])
+        elif "Function" in statement:
+            func = statement["Function"]
+            outer_caller, outer_locals = self.caller, self.caller_locals
+            self.caller = func["Name"]
+            self.caller_locals = (outer_locals | set(func["Parameters"])
+                                  | assigned_names(func["Body"])
+                                  | local_functions(func["Body"]))
+            func["Body"] = self._process_block(func["Body"])
+            self.caller, self.caller_locals = outer_caller, outer_locals
+
+    def _rewrite_statement(self, statement):
+        if "Declaration" in statement or "Assignment" in statement:
+            node = statement.get("Declaration") or statement.get("Assignment")
+            node["Expression"] = self._rewrite(node["Expression"])
+        elif "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            if_stmt["Condition"] = self._rewrite(if_stmt["Condition"])
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            loop_stmt["IterationCount"] = self._rewrite(loop_stmt["IterationCount"])
+        elif "DoUntilStatement" in statement:
+            # The condition is evaluated after the block on every iteration,
+            # nothing can be declared in front of the loop for it
+            self.allow_hoist = False
+            do_until_stmt = statement["DoUntilStatement"]
+            do_until_stmt["Condition"] = self._rewrite(do_until_stmt["Condition"])
+        elif "OutputStatement" in statement:
+            statement["OutputStatement"] = self._rewrite(statement["OutputStatement"])
+        elif "Return" in statement:
+            return_stmt = statement["Return"]
+            return_stmt["Expression"] = self._rewrite(return_stmt["Expression"])
+
+    def _is_pure_statement(self, statement):
+        for key in ("Declaration", "Assignment"):
+            if key in statement:
+                return self._is_pure(statement[key]["Expression"])
+        if "IfStatement" in statement:
+            return self._is_pure(statement["IfStatement"]["Condition"])
+        elif "LoopStatement" in statement:
+            return self._is_pure(statement["LoopStatement"]["IterationCount"])
+        elif "OutputStatement" in statement:
+            return self._is_pure(statement["OutputStatement"])
+        elif "Return" in statement:
+            return self._is_pure(statement["Return"]["Expression"])
+        return True
+
+    def _is_pure(self, expression):
+        return all(node["FunctionCall"]["Name"] in self.pure_functions
+                   for node in walk_expression(expression) if "FunctionCall" in node)
+
+    def _rewrite(self, expression):
+        if "Left" in expression and "Operator" in expression and "Right" in expression:
+            expression["Left"] = self._rewrite(expression["Left"])
+            expression["Right"] = self._rewrite(expression["Right"])
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            call["Arguments"] = [self._rewrite(arg) for arg in call["Arguments"]]
+            inlined = self._inline_call(call)
+            if inlined is not None:
+                return inlined
+        return expression
+
+    def _inline_call(self, call):
+        """
+        Returns the expression replacing the call, or None if it cannot be
+        inlined here.
+        """
+        func = self.inlinable.get(call["Name"])
+        if func is None or len(call["Arguments"]) != len(func["Parameters"]):
+            return None
+        if called_functions(func["Body"]) & self.caller_locals:
+            return None
+        body = copy_ast(func["Body"])
+        prefix = f"{self.TEMP_PREFIX}{self.instance_count}_"
+        assigned = assigned_names(body)
+        uses = {}
+        for expression in block_expressions(body):
+            if "Identifier" in expression:
+                uses[expression["Identifier"]] = uses.get(expression["Identifier"], 0) + 1
+
+        renames = {name: {"Identifier": prefix + name} for name in assigned}
+        temps = []
+        for param, arg in zip(func["Parameters"], call["Arguments"]):
+            if param not in assigned and self._can_substitute(arg, uses.get(param, 0)):
+                renames[param] = arg
+            else:
+                if not self._is_pure(arg):
+                    return None
+                renames[param] = {"Identifier": prefix + param}
+                temps.append({"Declaration": {"Identifier": prefix + param, "Expression": arg}})
+
+        if (temps or len(body) > 1) and not self.allow_hoist:
+            return None
+
+        self.instance_count += 1
+        self.inlined.append((self.caller, call["Name"]))
+        self.hoisted.extend(temps)
+        for statement in body[:-1]:
+            kind = "Declaration" if "Declaration" in statement else "Assignment"
+            node = statement[kind]
+            expression = self._rewrite(self._substitute(node["Expression"], renames))
+            self.hoisted.append({kind: {"Identifier": renames[node["Identifier"]]["Identifier"],
+                                        "Expression": expression}})
+        return self._rewrite(self._substitute(body[-1]["Return"]["Expression"], renames))
+
+    def _can_substitute(self, arg, uses):
+        """
+        An argument can replace its parameter if doing so still evaluates it
+        exactly once, or if it is a plain number or variable. Strings always go
+        through a temporary since `+` on them is emitted differently.
+        """
+        if "Literal" in arg or "Identifier" in arg:
+            return True
+        if any("StringLiteral" in node for node in walk_expression(arg)):
+            return False
+        return uses == 1 and self._is_pure(arg)
+
+    def _substitute(self, expression, renames):
+        if "Identifier" in expression:
+            return copy_ast(renames.get(expression["Identifier"], expression))
+        elif "Left" in expression and "Operator" in expression and "Right" in expression:
+            return {"Left": self._substitute(expression["Left"], renames),
+                    "Operator": expression["Operator"],
+                    "Right": self._substitute(expression["Right"], renames)}
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            return {"FunctionCall": {"Name": call["Name"],
+                                     "Arguments": [self._substitute(arg, renames)
+                                                   for arg in call["Arguments"]]}}
+        return copy_ast(expression)
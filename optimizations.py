@@ -0,0 +1,328 @@
+import math
+
+from analysis import (
+    ARITHMETIC_OPERATORS,
+    ProgramSummary,
+    assigned_names,
+    is_integer_expression,
+    walk_expression,
+)
+
+RELATIONAL_OPERATORS = {"==", "!=", "<", ">", "<=", ">="}
+
+# Larger folded integers are left for run time, e.g. squaring in a loop
+# body unrolled by propagation would otherwise grow without bound
+MAX_FOLDED_INT_BITS = 64
+
+
+def is_number(expression):
+    return "Literal" in expression and not isinstance(expression["Literal"], bool)
+
+
+def is_binary(expression):
+    return "Left" in expression and "Operator" in expression and "Right" in expression
+
+
+def contains_string(expression):
+    return any("StringLiteral" in node for node in walk_expression(expression))
+
+
+class ExpressionRewriter:
+    """
+    Base class for passes that rewrite every expression independently.
+    Subclasses implement `_simplify`, which receives a node whose operands
+    are already rewritten and returns its replacement.
+    """
+
+    def __init__(self, ast, summary=None):
+        self.ast = ast
+        self.summary = summary
+        self.changes = 0
+
+    def optimize(self):
+        self._process_block(self.ast["Program"])
+        return self.ast
+
+    def _process_block(self, block):
+        for statement in block:
+            if "Declaration" in statement or "Assignment" in statement:
+                node = statement.get("Declaration") or statement.get("Assignment")
+                node["Expression"] = self._rewrite(node["Expression"])
+            elif "IfStatement" in statement:
+                if_stmt = statement["IfStatement"]
+                if_stmt["Condition"] = self._rewrite(if_stmt["Condition"])
+                self._process_block(if_stmt["Then"])
+                if if_stmt.get("Else"):
+                    self._process_block(if_stmt["Else"])
+            elif "LoopStatement" in statement:
+                loop_stmt = statement["LoopStatement"]
+                loop_stmt["IterationCount"] = self._rewrite(loop_stmt["IterationCount"])
+                self._process_block(loop_stmt["Block"])
+            elif "DoUntilStatement" in statement:
+                do_until_stmt = statement["DoUntilStatement"]
+                self._process_block(do_until_stmt["Block"])
+                do_until_stmt["Condition"] = self._rewrite(do_until_stmt["Condition"])
+            elif "OutputStatement" in statement:
+                statement["OutputStatement"] = self._rewrite(statement["OutputStatement"])
+            elif "Function" in statement:
+                self._process_block(statement["Function"]["Body"])
+            elif "Return" in statement:
+                return_stmt = statement["Return"]
+                return_stmt["Expression"] = self._rewrite(return_stmt["Expression"])
+
+    def _rewrite(self, expression):
+        if is_binary(expression):
+            expression["Left"] = self._rewrite(expression["Left"])
+            expression["Right"] = self._rewrite(expression["Right"])
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            call["Arguments"] = [self._rewrite(arg) for arg in call["Arguments"]]
+        return self._simplify(expression)
+
+    def _simplify(self, expression):
+        return expression
+
+
+class ConstantFolder(ExpressionRewriter):
+    """
+    Constant folding: arithmetic on two number literals is computed at
+    compile time. Division by zero, float overflow and integers wider than
+    MAX_FOLDED_INT_BITS are left for run time.
+    """
+
+    def _simplify(self, expression):
+        if not is_binary(expression) or expression["Operator"] not in ARITHMETIC_OPERATORS:
+            return expression
+        if not is_number(expression["Left"]) or not is_number(expression["Right"]):
+            return expression
+        left = expression["Left"]["Literal"]
+        operator = expression["Operator"]
+        right = expression["Right"]["Literal"]
+        if operator == "+":
+            value = left + right
+        elif operator == "-":
+            value = left - right
+        elif operator == "*":
+            value = left * right
+        elif right != 0:
+            value = left / right
+        else:
+            return expression
+        # Overflowing floats have no literal form, leave them for run time
+        if isinstance(value, float) and not math.isfinite(value):
+            return expression
+        if isinstance(value, int) and value.bit_length() > MAX_FOLDED_INT_BITS:
+            return expression
+        self.changes += 1
+        return {"Literal": value}
+
+
+class AlgebraicSimplifier(ExpressionRewriter):
+    """
+    Algebraic simplification when one operand is a constant:
+    x * 1 and 1 * x become x. x + 0, 0 + x and x - 0 become x, and x * 0 and
+    0 * x become 0, only when x is known to be an integer without function
+    calls, since -0.0 + 0 is 0.0, x * 0 is -0.0 for negative floats and
+    x - 0 raises a TypeError when x holds a string. Operations with a string
+    literal operand are skipped, since `+` on them is emitted as
+    concatenation.
+    """
+
+    def __init__(self, ast, summary=None):
+        super().__init__(ast, summary or ProgramSummary(ast["Program"]))
+
+    def _simplify(self, expression):
+        if not is_binary(expression):
+            return expression
+        left = expression["Left"]
+        operator = expression["Operator"]
+        right = expression["Right"]
+        # Only integer constants: x + 0.0 or x * 1.0 would turn an int x into a float
+        left_value = left["Literal"] if "Literal" in left and type(left["Literal"]) is int else None
+        right_value = right["Literal"] if "Literal" in right and type(right["Literal"]) is int else None
+
+        result = expression
+        if operator == "+":
+            # x + 0 -> x, 0 + x -> x
+            if right_value == 0 and is_integer_expression(left, self.summary.integer_names):
+                result = left
+            elif left_value == 0 and is_integer_expression(right, self.summary.integer_names):
+                result = right
+        elif operator == "-":
+            # x - 0 -> x
+            if right_value == 0 and is_integer_expression(left, self.summary.integer_names):
+                result = left
+        elif operator == "*":
+            # x * 1 -> x, 1 * x -> x
+            # x * 0 -> 0, 0 * x -> 0
+            if right_value == 1:
+                result = left
+            elif left_value == 1:
+                result = right
+            elif right_value == 0 and is_integer_expression(left, self.summary.integer_names):
+                result = {"Literal": 0}
+            elif left_value == 0 and is_integer_expression(right, self.summary.integer_names):
+                result = {"Literal": 0}
+
+        if result is expression or contains_string(expression):
+            return expression
+        self.changes += 1
+        return result
+
+
+class ConstantPropagator:
+    """
+    Constant propagation: uses of a variable currently holding a number
+    literal are replaced by the literal.
+
+    Facts are tracked in program order. Both branches of an `if` start from
+    the facts before it and only the facts they agree on survive; variables
+    assigned in a loop body are forgotten before entering the loop; function
+    bodies start with no facts, since globals may change before the call.
+    """
+
+    def __init__(self, ast, summary=None):
+        self.ast = ast
+        self.changes = 0
+
+    def optimize(self):
+        self._process_block(self.ast["Program"], {})
+        return self.ast
+
+    def _process_block(self, block, constants):
+        for statement in block:
+            self._process_statement(statement, constants)
+        return constants
+
+    def _process_statement(self, statement, constants):
+        if "Declaration" in statement or "Assignment" in statement:
+            node = statement.get("Declaration") or statement.get("Assignment")
+            node["Expression"] = self._substitute(node["Expression"], constants)
+            if is_number(node["Expression"]):
+                constants[node["Identifier"]] = node["Expression"]["Literal"]
+            else:
+                constants.pop(node["Identifier"], None)
+        elif "IfStatement" in statement:
+            if_stmt = statement["IfStatement"]
+            if_stmt["Condition"] = self._substitute(if_stmt["Condition"], constants)
+            then_constants = self._process_block(if_stmt["Then"], dict(constants))
+            else_constants = dict(constants)
+            if if_stmt.get("Else"):
+                else_constants = self._process_block(if_stmt["Else"], else_constants)
+            merged = {name: value for name, value in then_constants.items()
+                      if name in else_constants and else_constants[name] == value
+                      and type(else_constants[name]) is type(value)}
+            constants.clear()
+            constants.update(merged)
+        elif "LoopStatement" in statement:
+            loop_stmt = statement["LoopStatement"]
+            loop_stmt["IterationCount"] = self._substitute(loop_stmt["IterationCount"], constants)
+            self._forget(constants, assigned_names(loop_stmt["Block"]))
+            self._process_block(loop_stmt["Block"], dict(constants))
+        elif "DoUntilStatement" in statement:
+            do_until_stmt = statement["DoUntilStatement"]
+            self._forget(constants, assigned_names(do_until_stmt["Block"]))
+            # The condition and the code after the loop run right after the block
+            self._process_block(do_until_stmt["Block"], constants)
+            do_until_stmt["Condition"] = self._substitute(do_until_stmt["Condition"], constants)
+        elif "OutputStatement" in statement:
+            statement["OutputStatement"] = self._substitute(statement["OutputStatement"], constants)
+        elif "Function" in statement:
+            self._process_block(statement["Function"]["Body"], {})
+        elif "Return" in statement:
+            return_stmt = statement["Return"]
+            return_stmt["Expression"] = self._substitute(return_stmt["Expression"], constants)
+
+    def _forget(self, constants, names):
+        for name in names:
+            constants.pop(name, None)
+
+    def _substitute(self, expression, constants):
+        if "Identifier" in expression:
+            identifier = expression["Identifier"]
+            if identifier in constants:
+                self.changes += 1
+                return {"Literal": constants[identifier]}
+        elif is_binary(expression):
+            expression["Left"] = self._substitute(expression["Left"], constants)
+            expression["Right"] = self._substitute(expression["Right"], constants)
+        elif "FunctionCall" in expression:
+            call = expression["FunctionCall"]
+            call["Arguments"] = [self._substitute(arg, constants) for arg in call["Arguments"]]
+        return expression
+
+
+class CompileTimeIfEliminator:
+    """
+    Compile-time if optimization: an `if` whose condition compares two number
+    literals is replaced by the branch that will run (or removed if that branch
+    does not exist). Loops with a literal iteration count of zero or less are
+    removed as well.
+    """
+
+    def __init__(self, ast, summary=None):
+        self.ast = ast
+        self.changes = 0
+
+    def optimize(self):
+        self.ast["Program"] = self._process_block(self.ast["Program"])
+        return self.ast
+
+    def _process_block(self, block):
+        result = []
+        for statement in block:
+            if "IfStatement" in statement:
+                if_stmt = statement["IfStatement"]
+                if_stmt["Then"] = self._process_block(if_stmt["Then"])
+                if if_stmt.get("Else"):
+                    if_stmt["Else"] = self._process_block(if_stmt["Else"])
+                condition_value = self._evaluate_condition(if_stmt["Condition"])
+                if condition_value is True:
+                    # Condition is always True, keep only the 'Then' block
+                    self.changes += 1
+                    result.extend(if_stmt["Then"])
+                    continue
+                elif condition_value is False:
+                    # Condition is always False, keep only the 'Else' block if present
+                    self.changes += 1
+                    result.extend(if_stmt.get("Else") or [])
+                    continue
+            elif "LoopStatement" in statement:
+                loop_stmt = statement["LoopStatement"]
+                loop_stmt["Block"] = self._process_block(loop_stmt["Block"])
+                count = loop_stmt["IterationCount"]
+                if is_number(count) and isinstance(count["Literal"], int) and count["Literal"] <= 0:
+                    self.changes += 1
+                    continue
+            elif "DoUntilStatement" in statement:
+                do_until_stmt = statement["DoUntilStatement"]
+                do_until_stmt["Block"] = self._process_block(do_until_stmt["Block"])
+            elif "Function" in statement:
+                func = statement["Function"]
+                func["Body"] = self._process_block(func["Body"])
+            result.append(statement)
+        return result
+
+    def _evaluate_condition(self, condition):
+        """
+        Returns True/False if the condition compares two number literals,
+        or None if it is not known at compile time.
+        """
+        if not is_binary(condition) or condition["Operator"] not in RELATIONAL_OPERATORS:
+            return None
+        if not is_number(condition["Left"]) or not is_number(condition["Right"]):
+            return None
+        left_val = condition["Left"]["Literal"]
+        right_val = condition["Right"]["Literal"]
+        operator = condition["Operator"]
+        if operator == "==":
+            return left_val == right_val
+        elif operator == "!=":
+            return left_val != right_val
+        elif operator == ">":
+            return left_val > right_val
+        elif operator == ">=":
+            return left_val >= right_val
+        elif operator == "<":
+            return left_val < right_val
+        return left_val <= right_val
@@ -0,0 +1,143 @@
+import time
+
+from analysis import ProgramSummary, copy_ast
+from cse import CommonSubexpressionEliminator
+from inliner import Inliner
+from optimizations import (
+    AlgebraicSimplifier,
+    CompileTimeIfEliminator,
+    ConstantFolder,
+    ConstantPropagator,
+)
+
+# Every pass is a class built from an AST and a ProgramSummary whose
+# optimize() returns the optimized AST and whose `changes` attribute counts
+# what it rewrote. Passes may rewrite the AST they are given in place.
+# They may also expose `messages`, a list of lines for the report.
+PASSES = {
+    "inline": Inliner,
+    "constant-propagation": ConstantPropagator,
+    "constant-folding": ConstantFolder,
+    "algebraic-simplification": AlgebraicSimplifier,
+    "compile-time-if": CompileTimeIfEliminator,
+    "cse": CommonSubexpressionEliminator,
+}
+
+# Consecutive passes from this set enable each other and are repeated
+# together until none of them changes anything
+FIXED_POINT_PASSES = {
+    "constant-propagation",
+    "constant-folding",
+    "algebraic-simplification",
+    "compile-time-if",
+}
+
+OPTIMIZATION_LEVELS = {
+    0: [],
+    1: ["constant-propagation", "constant-folding", "algebraic-simplification", "compile-time-if"],
+    2: ["inline", "constant-propagation", "constant-folding", "algebraic-simplification",
+        "compile-time-if", "cse"],
+}
+
+DEFAULT_OPTIMIZATION_LEVEL = 2
+MAX_ITERATIONS = 10
+
+
+class PassManager:
+    """
+    Runs a pipeline of AST-to-AST optimization passes between parsing and
+    code emission, recording the wall time and number of changes of each pass.
+    """
+
+    def __init__(self, passes):
+        unknown = [name for name in passes if name not in PASSES]
+        if unknown:
+            raise ValueError(f"Unknown optimization pass: {', '.join(unknown)}")
+        self.passes = list(passes)
+        self.stats = {name: {"runs": 0, "changes": 0, "time": 0.0} for name in self.passes}
+        self.messages = []
+        # Number of separately optimized parts of the program the statistics
+        # cover, and the wall time of the whole compilation if known
+        self.units = 1
+        self.wall_time = None
+
+    @classmethod
+    def for_level(cls, level):
+        if level not in OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown optimization level: {level}")
+        return cls(OPTIMIZATION_LEVELS[level])
+
+    def run(self, ast, summary=None):
+        """
+        Optimizes the AST. `summary` holds the whole-program facts when the
+        AST is only part of a program; by default it is computed from the AST.
+        """
+        if not self.passes:
+            return ast
+        if summary is None:
+            summary = ProgramSummary(ast["Program"])
+        # Passes work in place, keep the caller's AST intact
+        ast = copy_ast(ast)
+        for group in self._groups():
+            iterations = MAX_ITERATIONS if group[0] in FIXED_POINT_PASSES else 1
+            for _ in range(iterations):
+                changes = 0
+                for name in group:
+                    ast, pass_changes = self._run_pass(name, ast, summary)
+                    changes += pass_changes
+                if changes == 0:
+                    break
+        return ast
+
+    def _groups(self):
+        """
+        Splits the pipeline into groups: runs of consecutive fixed-point
+        passes, and every other pass on its own.
+        """
+        groups = []
+        for name in self.passes:
+            if groups and name in FIXED_POINT_PASSES and groups[-1][-1] in FIXED_POINT_PASSES:
+                groups[-1].append(name)
+            else:
+                groups.append([name])
+        return groups
+
+    def _run_pass(self, name, ast, summary):
+        start = time.perf_counter()
+        optimizer = PASSES[name](ast, summary)
+        ast = optimizer.optimize()
+        elapsed = time.perf_counter() - start
+
+        stats = self.stats[name]
+        stats["runs"] += 1
+        stats["changes"] += optimizer.changes
+        stats["time"] += elapsed
+        self.messages.extend(getattr(optimizer, "messages", []))
+        return ast, optimizer.changes
+
+    def merge(self, other):
+        """
+        Adds the statistics and messages of another run of the same pipeline.
+        """
+        for name, stats in other.stats.items():
+            for key, value in stats.items():
+                self.stats[name][key] += value
+        self.units += other.units
+        self.messages.extend(other.messages)
+
+    def report(self):
+        # With several units (possibly in parallel workers), runs and pass
+        # times are sums over all units, not the elapsed time
+        lines = []
+        if self.units > 1:
+            lines.append(f"Runs and times summed over {self.units} separately optimized units")
+        lines.append(f"{'Pass':<26}{'Runs':>6}{'Changes':>9}{'Sum (ms)':>11}")
+        total = 0.0
+        for name, stats in self.stats.items():
+            total += stats["time"]
+            lines.append(f"{name:<26}{stats['runs']:>6}{stats['changes']:>9}"
+                         f"{stats['time'] * 1000:>11.3f}")
+        lines.append(f"{'Total':<41}{total * 1000:>11.3f}")
+        if self.wall_time is not None:
+            lines.append(f"{'Wall time':<41}{self.wall_time * 1000:>11.3f}")
+        return lines + self.messages
@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from code_generator import compile_program
+from differential import ProgramGenerator, format_program, parse_source
+from pass_manager import OPTIMIZATION_LEVELS
+
+
+class ParallelCompilationTest(unittest.TestCase):
+    """
+    Compiling the functions of a program in several processes must give the
+    same code and report messages as compiling them one after the other.
+    """
+
+    SEED = 0
+    PROGRAMS = 20
+
+    def test_workers_do_not_change_result(self):
+        generator = ProgramGenerator(random.Random(self.SEED))
+        passes = OPTIMIZATION_LEVELS[2]
+        parallel = 0
+        for _ in range(self.PROGRAMS):
+            ast = parse_source(format_program(generator.generate()))
+            code, pass_manager = compile_program(ast, passes, workers=1)
+            parallel_code, parallel_pass_manager = compile_program(ast, passes, workers=2)
+            self.assertEqual(parallel_code, code)
+            self.assertEqual(parallel_pass_manager.messages, pass_manager.messages)
+            # Only programs with several functions are spread over processes
+            if sum("Function" in statement for statement in ast["Program"]) > 1:
+                parallel += 1
+        self.assertGreater(parallel, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import random
+import sys
+import unittest
+
+from differential import (
+    CONFIGURATIONS,
+    DifferentialTester,
+    ProgramGenerator,
+    ProgramRunner,
+    format_program,
+    parse_source,
+)
+
+
+class DifferentialTest(unittest.TestCase):
+    """
+    Runs the differential harness on a fixed batch of random programs, so
+    any optimization that changes a program's behavior fails the test suite.
+    """
+
+    SEED = 0
+    PROGRAMS = 100
+
+    def test_generated_programs_parse_back(self):
+        generator = ProgramGenerator(random.Random(self.SEED))
+        for _ in range(self.PROGRAMS):
+            ast = generator.generate()
+            self.assertEqual(parse_source(format_program(ast)), ast)
+
+    def test_optimizations_preserve_behavior(self):
+        generator = ProgramGenerator(random.Random(self.SEED))
+        runner = ProgramRunner()
+        self.addCleanup(runner.close)
+        tester = DifferentialTester(CONFIGURATIONS, runner, repeat=1)
+        for _ in range(self.PROGRAMS):
+            tester.check(parse_source(format_program(generator.generate())))
+        report = "\n".join(tester.report())
+        # The speedups are worth seeing when everything passes too
+        print(report, file=sys.stderr)
+        self.assertEqual(tester.failures, [], report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
 #!/bin/bash
 
-# Usage: ./tut_compiler.sh <source_file.tut> [--debug] [--exec]
+# Usage: ./tut_compiler.sh <source_file.tut> [--debug] [--exec] [-O0|-O1|-O2] [--passes=<pass,...>] [--jobs=<N>]
 
 SOURCE_FILE=$1
 DEBUG="false"
 EXEC="false"
+OPT_FLAGS=()
 
 # Check for flags
 for arg in "$@"; do
@@ -12,12 +13,14 @@ for arg in "$@"; do
     DEBUG="true"
   elif [ "$arg" == "--exec" ]; then
     EXEC="true"
+  elif [[ "$arg" == -O* || "$arg" == --passes=* || "$arg" == --jobs=* ]]; then
+    OPT_FLAGS+=("$arg")
   fi
 done
 
 # Check if source file is provided
 if [ -z "$SOURCE_FILE" ]; then
-  echo "Usage: ./tut_compiler.sh <source_file.tut> [--debug] [--exec]"
+  echo "Usage: ./tut_compiler.sh <source_file.tut> [--debug] [--exec] [-O0|-O1|-O2] [--passes=<pass,...>] [--jobs=<N>]"
   exit 1
 fi
 
@@ -69,7 +72,11 @@ fi
 if [ "$DEBUG" == "true" ]; then
   echo "Running code generator..."
 fi
-python3 code_generator.py "$AST_FILE" "$OUTPUT_PYTHON_FILE"
+if [ "$DEBUG" == "true" ]; then
+  python3 code_generator.py "$AST_FILE" "$OUTPUT_PYTHON_FILE" "${OPT_FLAGS[@]}" --report
+else
+  python3 code_generator.py "$AST_FILE" "$OUTPUT_PYTHON_FILE" "${OPT_FLAGS[@]}"
+fi
 if [ $? -ne 0 ]; then
   echo "Code generation failed. Exiting."
   exit 1